@@ -10,6 +10,7 @@ import logging
 import os
 import gc
 import threading
+from concurrent.futures import ThreadPoolExecutor
 
 # Pengaturan logging
 logging.basicConfig(
@@ -18,8 +19,63 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+def parse_cpu_list(value):
+    """Ubah daftar CPU seperti "0-3,6" menjadi list [0, 1, 2, 3, 6]"""
+    cpus = set()
+    for part in value.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            start, end = (int(x) for x in part.split("-", 1))
+            if start > end:
+                raise ValueError(f"Rentang CPU terbalik: {part}")
+            cpus.update(range(start, end + 1))
+        else:
+            cpus.add(int(part))
+    return sorted(cpus)
+
+
+def load_inference_config():
+    """Baca pengaturan thread inferensi CPU dari environment variable"""
+
+    def _int_env(name):
+        value = os.environ.get(name, "").strip()
+        if not value:
+            return None
+        try:
+            number = int(value)
+        except ValueError:
+            number = 0
+        if number < 1:
+            logger.warning(f"Nilai {name} tidak valid: {value}, diabaikan")
+            return None
+        return number
+
+    affinity = None
+    affinity_env = os.environ.get("CHATBOT_CPU_AFFINITY", "").strip()
+    if affinity_env:
+        try:
+            affinity = parse_cpu_list(affinity_env) or None
+        except ValueError:
+            logger.warning(
+                f"Nilai CHATBOT_CPU_AFFINITY tidak valid: {affinity_env}, diabaikan"
+            )
+
+    return {
+        "intra_op_threads": _int_env("CHATBOT_INTRA_OP_THREADS"),
+        "inter_op_threads": _int_env("CHATBOT_INTER_OP_THREADS"),
+        "workers": _int_env("CHATBOT_INFERENCE_WORKERS"),
+        "cpu_affinity": affinity,
+        "autotune": os.environ.get("CHATBOT_THREAD_AUTOTUNE", "").strip().lower()
+        in ("1", "true", "yes"),
+    }
+
+
 class ChatbotUPATIK:
-    def __init__(self, json_file_path=None, use_lightweight_model=True):
+    def __init__(
+        self, json_file_path=None, use_lightweight_model=True, inference_config=None
+    ):
         """
         TAHAP 1 INISIALISASI CHATBOT - DIOPTIMALKAN UNTUK MEMORI RENDAH
         """
@@ -33,6 +89,18 @@ class ChatbotUPATIK:
         self.question_embeddings = None
         self.processed_questions = None
 
+        # Pengaturan thread inferensi
+        self.inference_config = inference_config or load_inference_config()
+        self.inference_pool = None
+        self.inference_settings = {
+            "device": None,
+            "intra_op_threads": None,
+            "inter_op_threads": None,
+            "workers": None,
+            "cpu_affinity": None,
+            "autotune": None,
+        }
+
         # Muat dataset terlebih dahulu
         self.json_file_path = json_file_path
         self.load_dataset()
@@ -76,6 +144,9 @@ class ChatbotUPATIK:
                 device = "cpu"
                 logger.info("PyTorch tidak tersedia, menggunakan CPU")
 
+            # Atur thread dan affinity CPU sebelum model dimuat
+            self.configure_cpu_inference(device)
+
             # pilih model berdasarkan memori atau komputasi
             if use_lightweight_model:
                 model_names = [
@@ -109,6 +180,15 @@ class ChatbotUPATIK:
             # Generate embeddings
             self.generate_embeddings()
 
+            # Cari kombinasi thread terbaik jika auto-tune aktif
+            if self.inference_config["autotune"] and device == "cpu":
+                try:
+                    self.autotune_inference()
+                except Exception as e:
+                    logger.warning(f"Auto-tune thread inferensi gagal: {e}")
+
+            self.start_inference_pool(self.inference_config["workers"])
+
         except ImportError as e:
             logger.error(f"Library yang diperlukan tidak terinstal: {e}")
             logger.error(
@@ -291,6 +371,245 @@ class ChatbotUPATIK:
             self.question_embeddings = None
             self.processed_questions = processed_questions
 
+    def configure_cpu_inference(self, device):
+        """Atur intra-op/inter-op thread dan affinity CPU untuk encoder"""
+        config = self.inference_config
+        self.inference_settings["device"] = device
+
+        # Pin seluruh proses (semua thread) ke core tertentu jika diminta
+        affinity = self._apply_cpu_affinity()
+        self.inference_settings["cpu_affinity"] = affinity
+
+        if device != "cpu":
+            return
+
+        try:
+            import torch
+        except ImportError:
+            return
+
+        # Inter-op thread hanya bisa diatur sekali sebelum ada pekerjaan paralel
+        if config["inter_op_threads"]:
+            try:
+                torch.set_num_interop_threads(config["inter_op_threads"])
+            except RuntimeError as e:
+                logger.warning(f"Gagal mengatur inter-op threads: {e}")
+
+        # Tanpa pengaturan eksplisit, jangan buat thread melebihi core yang di-pin
+        intra_op_threads = config["intra_op_threads"]
+        if intra_op_threads is None and affinity:
+            intra_op_threads = len(affinity)
+        if intra_op_threads:
+            torch.set_num_threads(intra_op_threads)
+
+        self.inference_settings["intra_op_threads"] = torch.get_num_threads()
+        self.inference_settings["inter_op_threads"] = torch.get_num_interop_threads()
+        logger.info(
+            f"Thread inferensi CPU: intra-op={self.inference_settings['intra_op_threads']}, "
+            f"inter-op={self.inference_settings['inter_op_threads']}"
+        )
+
+    def _apply_cpu_affinity(self):
+        """
+        Pin seluruh proses ke core yang diminta, kembalikan daftar core yang dipakai.
+        Di Linux sched_setaffinity hanya berlaku per thread, jadi setiap thread
+        yang sudah berjalan di-pin satu per satu; thread baru mewarisi affinity
+        dari thread yang membuatnya.
+        """
+        cpus = self.inference_config["cpu_affinity"]
+        if not cpus:
+            return None
+
+        if not hasattr(os, "sched_setaffinity"):
+            logger.warning("CPU affinity tidak didukung di platform ini, diabaikan")
+            return None
+
+        available = set(os.sched_getaffinity(0))
+        valid_cpus = sorted(set(cpus) & available)
+        if not valid_cpus:
+            logger.warning(
+                f"CPU affinity {cpus} tidak cocok dengan core yang tersedia, diabaikan"
+            )
+            return None
+
+        try:
+            thread_ids = [int(tid) for tid in os.listdir("/proc/self/task")]
+        except OSError:
+            thread_ids = [0]
+
+        # Simpan affinity awal agar bisa dikembalikan jika pinning gagal di tengah jalan
+        original_affinity = {}
+        for tid in thread_ids:
+            try:
+                original_affinity[tid] = os.sched_getaffinity(tid)
+                os.sched_setaffinity(tid, valid_cpus)
+            except ProcessLookupError:
+                # Thread sudah selesai sebelum sempat di-pin
+                original_affinity.pop(tid, None)
+                continue
+            except OSError as e:
+                logger.warning(f"Gagal mengatur CPU affinity: {e}")
+                for pinned_tid, original in original_affinity.items():
+                    try:
+                        os.sched_setaffinity(pinned_tid, original)
+                    except OSError:
+                        pass
+                return None
+
+        logger.info(f"Proses di-pin ke core: {valid_cpus}")
+        return valid_cpus
+
+    def _create_inference_pool(self, workers):
+        """Buat thread pool khusus untuk encode query"""
+        return ThreadPoolExecutor(max_workers=workers, thread_name_prefix="inference")
+
+    def start_inference_pool(self, workers=None):
+        """Mulai pool inferensi dengan jumlah worker tertentu (default 1)"""
+        workers = workers or 1
+        if self.inference_pool is not None:
+            self.inference_pool.shutdown(wait=True)
+
+        self.inference_pool = self._create_inference_pool(workers)
+        self.inference_settings["workers"] = workers
+        logger.info(f"Pool inferensi dimulai dengan {workers} worker")
+
+    def _encode(self, texts):
+        """Encode teks menjadi embedding ternormalisasi"""
+        return self.model.encode(
+            texts, convert_to_tensor=False, normalize_embeddings=True
+        )
+
+    def encode_query(self, texts):
+        """Encode teks melalui pool inferensi agar jumlah thread tetap terkendali"""
+        if self.inference_pool is None:
+            return self._encode(texts)
+        return self.inference_pool.submit(self._encode, texts).result()
+
+    def _autotune_candidates(self, cpu_count):
+        """
+        Daftar kombinasi (intra-op threads, worker) yang diuji auto-tune.
+        Nilai yang diatur eksplisit lewat environment tetap dipakai apa adanya,
+        hanya nilai yang belum diatur yang dicari.
+        """
+        fixed_threads = self.inference_config["intra_op_threads"]
+        fixed_workers = self.inference_config["workers"]
+        options = sorted({n for n in (1, 2, 4, 8, 16) if n <= cpu_count} | {cpu_count})
+
+        if fixed_threads:
+            return [
+                (fixed_threads, w) for w in options if fixed_threads * w <= cpu_count
+            ] or [(fixed_threads, 1)]
+        if fixed_workers:
+            return [
+                (t, fixed_workers) for t in options if t * fixed_workers <= cpu_count
+            ] or [(1, fixed_workers)]
+        return [(t, max(1, cpu_count // t)) for t in options]
+
+    def autotune_inference(self, warmup_rounds=2, benchmark_requests=64, clients=None):
+        """
+        Benchmark beberapa kombinasi intra-op threads dan jumlah worker,
+        lalu pilih kombinasi dengan latensi p95 terbaik.
+        Setiap kombinasi diberi beban yang sama: `clients` request bersamaan
+        (seperti thread request Flask) dan `benchmark_requests` request total.
+        Latensi diukur dari submit sampai hasil diterima, termasuk waktu antre.
+        """
+        if self.inference_config["intra_op_threads"] and self.inference_config["workers"]:
+            logger.warning(
+                "Auto-tune dilewati: CHATBOT_INTRA_OP_THREADS dan "
+                "CHATBOT_INFERENCE_WORKERS sudah diatur"
+            )
+            return
+
+        import torch
+
+        cpu_count = len(
+            self.inference_settings["cpu_affinity"]
+            or (os.sched_getaffinity(0) if hasattr(os, "sched_getaffinity") else [])
+        ) or (os.cpu_count() or 1)
+        candidates = self._autotune_candidates(cpu_count)
+        clients = clients or max(2, cpu_count)
+
+        samples = [q for q in (self.processed_questions or []) if q][:8] or ["halo"]
+        queries = [samples[i % len(samples)] for i in range(benchmark_requests)]
+
+        logger.info(
+            f"Auto-tune thread inferensi: {len(candidates)} kombinasi diuji "
+            f"dengan {clients} client bersamaan"
+        )
+
+        original_threads = torch.get_num_threads()
+        best = None
+        try:
+            results = []
+            for threads, workers in candidates:
+                torch.set_num_threads(threads)
+                pool = self._create_inference_pool(workers)
+                client_pool = ThreadPoolExecutor(
+                    max_workers=clients, thread_name_prefix="autotune-client"
+                )
+
+                def timed_request(text, pool=pool):
+                    # Sama seperti encode_query di get_response: submit lalu tunggu
+                    submitted_at = time.perf_counter()
+                    pool.submit(self._encode, [text]).result()
+                    return time.perf_counter() - submitted_at
+
+                try:
+                    # Warm-up: barrier memaksa setiap worker benar-benar dibuat dan
+                    # meng-encode sebelum pengukuran dimulai
+                    for _ in range(warmup_rounds):
+                        barrier = threading.Barrier(workers)
+
+                        def warm_up(text, barrier=barrier):
+                            barrier.wait(timeout=60)
+                            self._encode([text])
+
+                        list(
+                            pool.map(
+                                warm_up,
+                                [samples[i % len(samples)] for i in range(workers)],
+                            )
+                        )
+
+                    latencies = list(client_pool.map(timed_request, queries))
+                finally:
+                    client_pool.shutdown(wait=True)
+                    pool.shutdown(wait=True)
+
+                p95 = float(np.percentile(latencies, 95))
+                results.append(
+                    {
+                        "intra_op_threads": threads,
+                        "workers": workers,
+                        "p95_latency": round(p95, 4),
+                        "mean_latency": round(float(np.mean(latencies)), 4),
+                    }
+                )
+                logger.info(
+                    f"Auto-tune threads={threads}, workers={workers}: p95={p95:.4f}s"
+                )
+
+            best = min(results, key=lambda r: r["p95_latency"])
+            torch.set_num_threads(best["intra_op_threads"])
+            self.inference_config["intra_op_threads"] = best["intra_op_threads"]
+            self.inference_config["workers"] = best["workers"]
+            self.inference_settings["autotune"] = {
+                "best": best,
+                "candidates": results,
+                "clients": clients,
+                "requests": benchmark_requests,
+            }
+        finally:
+            # Jika auto-tune gagal, kembalikan jumlah thread sebelum tuning
+            if best is None:
+                torch.set_num_threads(original_threads)
+            self.inference_settings["intra_op_threads"] = torch.get_num_threads()
+
+        logger.info(
+            f"Auto-tune selesai: threads={best['intra_op_threads']}, "
+            f"workers={best['workers']}, p95={best['p95_latency']}s"
+        )
+
     def get_response(self, user_input):
         """Dapatkan respon untuk input pengguna"""
         start_time = time.time()
@@ -307,9 +626,7 @@ class ChatbotUPATIK:
 
         try:
             # Generate embedding input pengguna
-            user_embedding = self.model.encode(
-                [processed_input], convert_to_tensor=False, normalize_embeddings=True
-            )
+            user_embedding = self.encode_query([processed_input])
 
             # Menghitung similarity
             similarities = self.cosine_similarity(
@@ -608,6 +925,7 @@ def get_stats():
             "categories": list(chatbot.df["kategori"].unique()),
             "threshold": chatbot.threshold,
             "model_available": chatbot.model is not None,
+            "inference": chatbot.inference_settings,
         }
 
         return jsonify(stats)
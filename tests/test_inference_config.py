@@ -0,0 +1,375 @@
+import logging
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+import server
+from server import ChatbotUPATIK, load_inference_config, parse_cpu_list
+
+
+ENV_NAMES = [
+    "CHATBOT_INTRA_OP_THREADS",
+    "CHATBOT_INTER_OP_THREADS",
+    "CHATBOT_INFERENCE_WORKERS",
+    "CHATBOT_CPU_AFFINITY",
+    "CHATBOT_THREAD_AUTOTUNE",
+]
+
+
+class FakeModel:
+    def __init__(self):
+        self.calls = []
+
+    def encode(self, texts, convert_to_tensor=False, normalize_embeddings=True):
+        self.calls.append((list(texts), threading.current_thread().name))
+        return [[1.0, 0.0] for _ in texts]
+
+
+class FakeTorch:
+    """Pengganti modul torch: hanya menyimpan jumlah thread"""
+
+    def __init__(self, num_threads=4, interop_error=None):
+        self.num_threads = num_threads
+        self.num_interop_threads = 4
+        self.interop_error = interop_error
+
+    def set_num_threads(self, n):
+        self.num_threads = n
+
+    def get_num_threads(self):
+        return self.num_threads
+
+    def set_num_interop_threads(self, n):
+        if self.interop_error:
+            raise RuntimeError(self.interop_error)
+        self.num_interop_threads = n
+
+    def get_num_interop_threads(self):
+        return self.num_interop_threads
+
+
+class SlowModel:
+    """Model palsu dengan latensi tetap per jumlah thread torch"""
+
+    def __init__(self, torch, latency_by_threads, fail_on_threads=None):
+        self.torch = torch
+        self.latency_by_threads = latency_by_threads
+        self.fail_on_threads = fail_on_threads
+
+    def encode(self, texts, convert_to_tensor=False, normalize_embeddings=True):
+        threads = self.torch.get_num_threads()
+        if threads == self.fail_on_threads:
+            raise RuntimeError("encode gagal")
+        time.sleep(self.latency_by_threads.get(threads, 0.01))
+        return [[1.0, 0.0] for _ in texts]
+
+
+@pytest.fixture
+def fake_torch(monkeypatch):
+    torch = FakeTorch()
+    monkeypatch.setitem(sys.modules, "torch", torch)
+    return torch
+
+
+@pytest.fixture
+def clean_env(monkeypatch):
+    for name in ENV_NAMES:
+        monkeypatch.delenv(name, raising=False)
+    return monkeypatch
+
+
+def make_chatbot(inference_config=None):
+    """Buat chatbot tanpa memuat dataset dan model"""
+    chatbot = ChatbotUPATIK.__new__(ChatbotUPATIK)
+    chatbot.model = FakeModel()
+    chatbot.inference_pool = None
+    chatbot.inference_config = inference_config or {
+        "intra_op_threads": None,
+        "inter_op_threads": None,
+        "workers": None,
+        "cpu_affinity": None,
+        "autotune": False,
+    }
+    chatbot.inference_settings = {
+        "device": None,
+        "intra_op_threads": None,
+        "inter_op_threads": None,
+        "workers": None,
+        "cpu_affinity": None,
+        "autotune": None,
+    }
+    chatbot.processed_questions = ["halo", "lupa password siakad"]
+    return chatbot
+
+
+def test_parse_cpu_list_ranges_and_single_cpus():
+    assert parse_cpu_list("0-3,6") == [0, 1, 2, 3, 6]
+    assert parse_cpu_list(" 2, 0-1 ,2,") == [0, 1, 2]
+    assert parse_cpu_list("5-5") == [5]
+
+
+@pytest.mark.parametrize("value", ["3-1", "a", "1-b", "-1"])
+def test_parse_cpu_list_rejects_invalid(value):
+    with pytest.raises(ValueError):
+        parse_cpu_list(value)
+
+
+def test_load_inference_config_defaults(clean_env):
+    assert load_inference_config() == {
+        "intra_op_threads": None,
+        "inter_op_threads": None,
+        "workers": None,
+        "cpu_affinity": None,
+        "autotune": False,
+    }
+
+
+def test_load_inference_config_reads_env(clean_env):
+    clean_env.setenv("CHATBOT_INTRA_OP_THREADS", "2")
+    clean_env.setenv("CHATBOT_INTER_OP_THREADS", "1")
+    clean_env.setenv("CHATBOT_INFERENCE_WORKERS", "3")
+    clean_env.setenv("CHATBOT_CPU_AFFINITY", "0-1,4")
+    clean_env.setenv("CHATBOT_THREAD_AUTOTUNE", "True")
+
+    assert load_inference_config() == {
+        "intra_op_threads": 2,
+        "inter_op_threads": 1,
+        "workers": 3,
+        "cpu_affinity": [0, 1, 4],
+        "autotune": True,
+    }
+
+
+@pytest.mark.parametrize("value", ["abc", "0", "-2", "1.5"])
+def test_load_inference_config_ignores_invalid_numbers(clean_env, caplog, value):
+    clean_env.setenv("CHATBOT_INFERENCE_WORKERS", value)
+
+    with caplog.at_level(logging.WARNING):
+        config = load_inference_config()
+
+    assert config["workers"] is None
+    assert "CHATBOT_INFERENCE_WORKERS tidak valid" in caplog.text
+
+
+def test_load_inference_config_warns_on_reversed_affinity(clean_env, caplog):
+    clean_env.setenv("CHATBOT_CPU_AFFINITY", "3-1")
+
+    with caplog.at_level(logging.WARNING):
+        config = load_inference_config()
+
+    assert config["cpu_affinity"] is None
+    assert "CHATBOT_CPU_AFFINITY tidak valid" in caplog.text
+
+
+def test_encode_query_without_pool_encodes_directly():
+    chatbot = make_chatbot()
+
+    assert chatbot.encode_query(["halo"]) == [[1.0, 0.0]]
+    assert chatbot.model.calls == [(["halo"], threading.current_thread().name)]
+
+
+def test_encode_query_uses_inference_pool():
+    chatbot = make_chatbot()
+    chatbot.start_inference_pool()
+    try:
+        assert chatbot.encode_query(["halo"]) == [[1.0, 0.0]]
+    finally:
+        chatbot.inference_pool.shutdown(wait=True)
+
+    assert chatbot.inference_settings["workers"] == 1
+    assert chatbot.model.calls[0][1].startswith("inference")
+
+
+def test_autotune_candidates_without_explicit_values():
+    chatbot = make_chatbot()
+
+    assert chatbot._autotune_candidates(4) == [(1, 4), (2, 2), (4, 1)]
+    assert chatbot._autotune_candidates(6) == [(1, 6), (2, 3), (4, 1), (6, 1)]
+
+
+def test_autotune_candidates_keep_explicit_threads():
+    chatbot = make_chatbot()
+    chatbot.inference_config["intra_op_threads"] = 2
+
+    assert chatbot._autotune_candidates(4) == [(2, 1), (2, 2)]
+    assert chatbot._autotune_candidates(1) == [(2, 1)]
+
+
+def test_autotune_candidates_keep_explicit_workers():
+    chatbot = make_chatbot()
+    chatbot.inference_config["workers"] = 2
+
+    assert chatbot._autotune_candidates(4) == [(1, 2), (2, 2)]
+
+
+@pytest.mark.skipif(
+    not hasattr(os, "sched_setaffinity"), reason="CPU affinity tidak didukung"
+)
+def test_apply_cpu_affinity_pins_every_thread():
+    available = sorted(os.sched_getaffinity(0))
+    chatbot = make_chatbot()
+    chatbot.inference_config["cpu_affinity"] = available + [max(available) + 1000]
+
+    release = threading.Event()
+    worker = threading.Thread(target=release.wait)
+    worker.start()
+    try:
+        assert chatbot._apply_cpu_affinity() == available
+        for tid in os.listdir("/proc/self/task"):
+            assert sorted(os.sched_getaffinity(int(tid))) == available
+    finally:
+        release.set()
+        worker.join()
+
+
+def test_apply_cpu_affinity_ignores_unavailable_cpus(caplog):
+    chatbot = make_chatbot()
+    chatbot.inference_config["cpu_affinity"] = [100000]
+
+    with caplog.at_level(logging.WARNING, logger=server.logger.name):
+        assert chatbot._apply_cpu_affinity() is None
+
+    if hasattr(os, "sched_setaffinity"):
+        assert "tidak cocok dengan core yang tersedia" in caplog.text
+
+
+@pytest.mark.skipif(
+    not hasattr(os, "sched_setaffinity"), reason="CPU affinity tidak didukung"
+)
+def test_apply_cpu_affinity_restores_threads_on_failure(monkeypatch):
+    available = sorted(os.sched_getaffinity(0))
+    chatbot = make_chatbot()
+    chatbot.inference_config["cpu_affinity"] = available[:1]
+
+    applied = {}
+    real_getaffinity = os.sched_getaffinity
+
+    def fake_setaffinity(tid, cpus):
+        if tid == 2:
+            raise PermissionError("ditolak")
+        applied[tid] = sorted(cpus)
+
+    monkeypatch.setattr(os, "listdir", lambda path: ["1", "2", "3"])
+    monkeypatch.setattr(
+        os, "sched_getaffinity", lambda tid: set(real_getaffinity(0))
+    )
+    monkeypatch.setattr(os, "sched_setaffinity", fake_setaffinity)
+
+    assert chatbot._apply_cpu_affinity() is None
+    # Thread 1 sempat di-pin lalu dikembalikan ke affinity awal
+    assert applied == {1: available}
+
+
+def test_configure_cpu_inference_defaults_threads_to_pinned_cores(fake_torch):
+    chatbot = make_chatbot()
+    chatbot._apply_cpu_affinity = lambda: [0, 1]
+
+    chatbot.configure_cpu_inference("cpu")
+
+    assert fake_torch.num_threads == 2
+    assert chatbot.inference_settings["device"] == "cpu"
+    assert chatbot.inference_settings["cpu_affinity"] == [0, 1]
+    assert chatbot.inference_settings["intra_op_threads"] == 2
+
+
+def test_configure_cpu_inference_explicit_threads_win_over_affinity(fake_torch):
+    chatbot = make_chatbot()
+    chatbot.inference_config["intra_op_threads"] = 3
+    chatbot._apply_cpu_affinity = lambda: [0, 1]
+
+    chatbot.configure_cpu_inference("cpu")
+
+    assert chatbot.inference_settings["intra_op_threads"] == 3
+
+
+def test_configure_cpu_inference_handles_interop_error(monkeypatch, caplog):
+    torch = FakeTorch(interop_error="sudah diatur")
+    monkeypatch.setitem(sys.modules, "torch", torch)
+    chatbot = make_chatbot()
+    chatbot.inference_config["inter_op_threads"] = 1
+
+    with caplog.at_level(logging.WARNING):
+        chatbot.configure_cpu_inference("cpu")
+
+    assert "Gagal mengatur inter-op threads" in caplog.text
+    assert chatbot.inference_settings["inter_op_threads"] == 4
+    assert chatbot.inference_settings["intra_op_threads"] == 4
+
+
+def test_configure_cpu_inference_skips_threads_on_gpu(fake_torch):
+    chatbot = make_chatbot()
+    chatbot.inference_config["intra_op_threads"] = 1
+
+    chatbot.configure_cpu_inference("cuda")
+
+    assert fake_torch.num_threads == 4
+    assert chatbot.inference_settings["device"] == "cuda"
+    assert chatbot.inference_settings["intra_op_threads"] is None
+
+
+def test_autotune_picks_best_p95(fake_torch):
+    chatbot = make_chatbot()
+    chatbot.model = SlowModel(fake_torch, {1: 0.02, 2: 0.002, 4: 0.02})
+    chatbot.inference_settings["cpu_affinity"] = [0, 1, 2, 3]
+
+    chatbot.autotune_inference(warmup_rounds=1, benchmark_requests=16)
+
+    autotune = chatbot.inference_settings["autotune"]
+    assert autotune["best"]["intra_op_threads"] == 2
+    assert autotune["best"]["workers"] == 2
+    assert autotune["clients"] == 4
+    assert autotune["requests"] == 16
+    assert [(c["intra_op_threads"], c["workers"]) for c in autotune["candidates"]] == [
+        (1, 4),
+        (2, 2),
+        (4, 1),
+    ]
+    assert fake_torch.num_threads == 2
+    assert chatbot.inference_settings["intra_op_threads"] == 2
+    assert chatbot.inference_config["workers"] == 2
+
+
+def test_autotune_counts_queue_time(fake_torch):
+    # Dengan 1 worker dan 4 client, request harus antre di belakang yang lain
+    chatbot = make_chatbot()
+    chatbot.model = SlowModel(fake_torch, {1: 0.01})
+    chatbot.inference_config["intra_op_threads"] = 1
+    chatbot.inference_settings["cpu_affinity"] = [0]
+
+    chatbot.autotune_inference(warmup_rounds=1, benchmark_requests=8, clients=4)
+
+    best = chatbot.inference_settings["autotune"]["best"]
+    assert (best["intra_op_threads"], best["workers"]) == (1, 1)
+    assert best["p95_latency"] >= 0.03
+
+
+def test_autotune_skipped_when_threads_and_workers_set(fake_torch, caplog):
+    chatbot = make_chatbot()
+    chatbot.model = SlowModel(fake_torch, {})
+    chatbot.inference_config["intra_op_threads"] = 2
+    chatbot.inference_config["workers"] = 2
+
+    with caplog.at_level(logging.WARNING):
+        chatbot.autotune_inference()
+
+    assert "Auto-tune dilewati" in caplog.text
+    assert chatbot.inference_settings["autotune"] is None
+    assert fake_torch.num_threads == 4
+
+
+def test_autotune_failure_restores_threads(fake_torch):
+    chatbot = make_chatbot()
+    fake_torch.num_threads = 3
+    chatbot.model = SlowModel(fake_torch, {1: 0.001, 2: 0.001}, fail_on_threads=4)
+    chatbot.inference_settings["cpu_affinity"] = [0, 1, 2, 3]
+
+    with pytest.raises(RuntimeError):
+        chatbot.autotune_inference(warmup_rounds=1, benchmark_requests=4)
+
+    assert fake_torch.num_threads == 3
+    assert chatbot.inference_settings["intra_op_threads"] == 3
+    assert chatbot.inference_settings["autotune"] is None
+    assert chatbot.inference_config["intra_op_threads"] is None